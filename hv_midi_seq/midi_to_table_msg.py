@@ -20,40 +20,65 @@ The output is one .txt file containing a single message box that:
 To switch songs, just trigger a different song's message box.
 
 Usage:
-    pip install mido
+    pip install mido numpy
+    pip install symusic          # optional, much faster MIDI parsing
     python3 midi_to_table_msg.py mysong.mid
     python3 midi_to_table_msg.py mysong.mid --max-voices 3
+    python3 midi_to_table_msg.py songs/ --batch --jobs 4
+    python3 midi_to_table_msg.py "songs/*.mid" --batch
 """
 
+import os
 import sys
+import glob
+import heapq
 import argparse
+from array import array
+from collections import deque
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
 import mido
+import numpy as np
+
+try:
+    import symusic
+    HAS_SYMUSIC = True
+except ImportError:
+    HAS_SYMUSIC = False
 
 
 # ---------------------------------------------------------------------------
 # Timing
 # ---------------------------------------------------------------------------
 
-def build_tempo_map(mid):
-    tmap = [(0, 500000)]
-    abs_tick = 0
-    for msg in mido.merge_tracks(mid.tracks):
-        abs_tick += msg.time
-        if msg.type == "set_tempo":
-            tmap.append((abs_tick, msg.tempo))
-    return tmap
-
-
-def abs_ticks_to_ms(abs_tick, ppq, tempo_map):
-    ms = 0.0
-    prev_tick, prev_tempo = tempo_map[0]
-    for seg_tick, seg_tempo in tempo_map[1:]:
-        if abs_tick <= seg_tick:
-            break
-        ms += (seg_tick - prev_tick) * (prev_tempo / ppq / 1000.0)
-        prev_tick, prev_tempo = seg_tick, seg_tempo
-    ms += (abs_tick - prev_tick) * (prev_tempo / ppq / 1000.0)
-    return ms
+def build_tempo_map(tempo_events, ppq):
+    """Return parallel (ticks, tempos, cum_us_ppq) arrays, one entry per tempo change.
+
+    tempo_events yields (abs_tick, tempo) pairs in tick order.  cum_us_ppq[i]
+    is the absolute time at ticks[i] in microseconds times ppq, i.e. the exact
+    integer sum of ticks * tempo over the preceding segments.  Any tick then
+    resolves with one search, a multiply-add and a single division by
+    ppq * 1000, with no float error accumulated across tempo changes.
+    """
+    ticks      = [0]
+    tempos     = [500000]
+    cum_us_ppq = [0]
+    for abs_tick, tempo in tempo_events:
+        cum_us_ppq.append(cum_us_ppq[-1] + (abs_tick - ticks[-1]) * tempos[-1])
+        ticks.append(abs_tick)
+        tempos.append(tempo)
+    return (np.asarray(ticks,      dtype=np.int64),
+            np.asarray(tempos,     dtype=np.int64),
+            np.asarray(cum_us_ppq, dtype=np.int64))
+
+
+def abs_ticks_to_ms(abs_ticks, ppq, tempo_map):
+    """Convert an array of absolute ticks to ms in one vectorized pass."""
+    ticks, tempos, cum_us_ppq = tempo_map
+    abs_ticks = np.asarray(abs_ticks, dtype=np.int64)
+    i = np.searchsorted(ticks, abs_ticks, side="right") - 1
+    return (cum_us_ppq[i] + (abs_ticks - ticks[i]) * tempos[i]) / (ppq * 1000.0)
 
 
 # ---------------------------------------------------------------------------
@@ -61,35 +86,109 @@ def abs_ticks_to_ms(abs_tick, ppq, tempo_map):
 # ---------------------------------------------------------------------------
 
 def extract(midi_path):
-    mid = mido.MidiFile(midi_path)
-    ppq = mid.ticks_per_beat
-    tempo_map = build_tempo_map(mid)
-    current_tempo = 500000
+    """Return (notes, ppq, first_tempo).
 
-    active = {}
-    notes  = []
-    abs_tick = 0
+    notes is a struct of parallel arrays
+    (pitches, vels, durs_ms, onsets_ms, offsets_ms) sorted by (onset, pitch).
+    """
+    if HAS_SYMUSIC:
+        return extract_symusic(midi_path)
+    return extract_mido(midi_path)
 
-    for msg in mido.merge_tracks(mid.tracks):
-        abs_tick += msg.time
 
-        if msg.type == "set_tempo":
-            current_tempo = msg.tempo
+def extract_symusic(midi_path):
+    # Load in ticks rather than ttype="Second": symusic stores seconds as
+    # float32, which is coarser than the 3 decimals of ms we write out.
+    score = symusic.Score(midi_path)
+    ppq   = score.ticks_per_quarter
+    tempo_map = build_tempo_map(((t.time, t.mspq) for t in score.tempos), ppq)
+    first_tempo = score.tempos[0].mspq if len(score.tempos) else 500000
 
-        elif msg.type == "note_on" and msg.velocity > 0:
-            active[(msg.note, msg.channel)] = (abs_tick, msg.velocity)
+    tracks = [track.notes.numpy() for track in score.tracks]
 
-        elif msg.type == "note_off" or (msg.type == "note_on" and msg.velocity == 0):
-            key = (msg.note, msg.channel)
-            if key in active:
-                on_tick, vel = active.pop(key)
-                onset_ms  = round(abs_ticks_to_ms(on_tick,  ppq, tempo_map), 3)
-                offset_ms = round(abs_ticks_to_ms(abs_tick, ppq, tempo_map), 3)
-                dur_ms    = round(offset_ms - onset_ms, 3)
-                notes.append((msg.note, vel, dur_ms, onset_ms))
+    def column(key):
+        if not tracks:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([cols[key] for cols in tracks]).astype(np.int64)
+
+    on_ticks  = column("time")
+    off_ticks = on_ticks + column("duration")
+    notes = finish_notes(column("pitch"), column("velocity"),
+                         on_ticks, off_ticks, ppq, tempo_map)
+    return notes, ppq, first_tempo
+
+
+def extract_mido(midi_path):
+    mid = mido.MidiFile(midi_path)
+    ppq = mid.ticks_per_beat
 
-    notes.sort(key=lambda n: (n[3], n[0]))
-    return notes, ppq
+    # Walk each track on its own so notes pair per (track, note, channel),
+    # first-in first-out, the same way symusic pairs them: overlapping
+    # same-key notes in different tracks are all kept.  Tempo changes are
+    # collected as they go by and the tempo map is built afterwards, since
+    # note ticks are only resolved to ms once the walk is done.  Sounding
+    # notes live in a flat per-track list indexed by (note << 4) | channel;
+    # each slot is a FIFO, created on first use, of (on_tick << 7) | velocity
+    # ints, so a note event costs no tuple allocation or hashing.
+    tempo_events = []
+    pitches      = array("B")
+    vels         = array("B")
+    on_ticks     = array("q")
+    off_ticks    = array("q")
+
+    for track in mid.tracks:
+        active   = [None] * 2048
+        abs_tick = 0
+
+        for msg in track:
+            abs_tick += msg.time
+            kind = msg.type
+
+            if kind == "note_on" and msg.velocity > 0:
+                k = (msg.note << 4) | msg.channel
+                pending = active[k]
+                if pending is None:
+                    pending = active[k] = deque()
+                pending.append((abs_tick << 7) | msg.velocity)
+
+            elif kind == "note_off" or kind == "note_on":
+                pending = active[(msg.note << 4) | msg.channel]
+                if pending:
+                    packed = pending.popleft()
+                    pitches.append(msg.note)
+                    vels.append(packed & 0x7F)
+                    on_ticks.append(packed >> 7)
+                    off_ticks.append(abs_tick)
+
+            elif kind == "set_tempo":
+                tempo_events.append((abs_tick, msg.tempo))
+
+    # Stable sort keeps track order for tempo changes on the same tick
+    tempo_events.sort(key=lambda e: e[0])
+    tempo_map   = build_tempo_map(tempo_events, ppq)
+    first_tempo = tempo_events[0][1] if tempo_events else 500000
+    notes = finish_notes(pitches, vels, on_ticks, off_ticks, ppq, tempo_map)
+    return notes, ppq, first_tempo
+
+
+def finish_notes(pitches, vels, on_ticks, off_ticks, ppq, tempo_map):
+    """Resolve raw note ticks to ms and return the note arrays sorted by onset, then pitch."""
+    # Pitch and velocity are 7-bit MIDI values
+    pitches = np.asarray(pitches, dtype=np.uint8)
+    vels    = np.asarray(vels,    dtype=np.uint8)
+
+    # Resolve every note's on and off tick against the tempo map in one batch.
+    # Values stay unrounded; fmt() rounds to 3 decimals on output.
+    n  = len(pitches)
+    ms = abs_ticks_to_ms(np.concatenate((on_ticks, off_ticks)), ppq, tempo_map)
+    onset_ms, offset_ms = ms[:n], ms[n:]
+    dur_ms = offset_ms - onset_ms
+
+    # lexsort keys on the last array first: (onset, pitch, offset, vel).  The
+    # offset/vel tie-break keeps the order independent of which backend
+    # produced the notes.
+    order = np.lexsort((vels, offset_ms, pitches, onset_ms))
+    return pitches[order], vels[order], dur_ms[order], onset_ms[order], offset_ms[order]
 
 
 # ---------------------------------------------------------------------------
@@ -97,37 +196,40 @@ def extract(midi_path):
 # ---------------------------------------------------------------------------
 
 def assign_voices(notes, max_voices):
+    """Return one (pitches, vels, durs_ms) array triple per voice, all equal length."""
+    pitches, vels, durs_ms, onsets_ms, offsets_ms = notes
+    voice_of = []
+    nv       = 0
+    heap     = []  # (end_ms, voice index), earliest-ending voice on top
+
+    # Compare against the resolved offsets rather than onset + dur: with
+    # unrounded ms the sum can miss the next note's onset by an ulp and
+    # break legato voice reuse.
+    for onset_ms, offset_ms in zip(onsets_ms.tolist(), offsets_ms.tolist()):
+        # Reuse the earliest-ending voice if it is free, or steal it when
+        # every voice is taken; otherwise open a new voice.
+        if heap and (onset_ms >= heap[0][0] or (max_voices and nv >= max_voices)):
+            i = heap[0][1]
+            heapq.heapreplace(heap, (offset_ms, i))
+        else:
+            i = nv
+            nv += 1
+            heapq.heappush(heap, (offset_ms, i))
+        voice_of.append(i)
+
+    # Tally every voice's length in one pass; voices past nv count as empty
+    voice_of = np.asarray(voice_of, dtype=np.int64)
+    counts   = np.bincount(voice_of, minlength=max(nv, max_voices or 0))
+    max_len  = counts.max()
+
+    # Pad shorter voices with rests, and if fewer voices than max_voices,
+    # pad with silent voice tables
     voices = []
-    end_ms = []
-
-    for pitch, vel, dur_ms, onset_ms in notes:
-        placed = False
-        for i in range(len(voices)):
-            if onset_ms >= end_ms[i]:
-                voices[i].append((pitch, vel, dur_ms))
-                end_ms[i] = onset_ms + dur_ms
-                placed = True
-                break
-
-        if not placed:
-            if max_voices and len(voices) >= max_voices:
-                i = end_ms.index(min(end_ms))
-                voices[i].append((pitch, vel, dur_ms))
-                end_ms[i] = onset_ms + dur_ms
-            else:
-                voices.append([(pitch, vel, dur_ms)])
-                end_ms.append(onset_ms + dur_ms)
-
-    max_len = max(len(v) for v in voices)
-
-    # Pad shorter voices and fill missing voices with all rests
-    for v in voices:
-        while len(v) < max_len:
-            v.append((0, 0, 0.0))
-
-    # If fewer voices than max_voices, pad with silent voice tables
-    while max_voices and len(voices) < max_voices:
-        voices.append([(0, 0, 0.0)] * max_len)
+    for vi, count in enumerate(counts.tolist()):
+        sel = voice_of == vi
+        pad = max_len - count
+        voices.append(tuple(np.concatenate((col[sel], np.zeros(pad, dtype=col.dtype)))
+                            for col in (pitches, vels, durs_ms)))
 
     return voices
 
@@ -141,19 +243,20 @@ def fmt(v):
     return s if s else "0"
 
 
+@lru_cache(maxsize=8)
 def xlabel_marks(n, max_marks=20):
     if n <= max_marks:
-        return list(range(n))
+        return tuple(range(n))
     step = max(1, n // max_marks)
     marks = list(range(0, n, step))
     if marks[-1] != n - 1:
         marks.append(n - 1)
-    return marks
+    return tuple(marks)
 
 
-def table_lines(table_name, values, y_min, y_max):
-    """Return a list of semicolon-terminated Pd message strings for one table."""
-    n       = len(values)
+@lru_cache(maxsize=8)
+def axis_labels(n, y_min, y_max):
+    """Return the (bounds, xlabel, ylabel) strings, shared by every table of the same shape."""
     bounds  = f"0 {fmt(y_max * 1.1)} {n} {fmt(max(0, y_min - y_max * 0.1))}"
     x_marks = xlabel_marks(n)
     xlabel  = f"-0.5 {' '.join(str(i) for i in x_marks)}"
@@ -161,7 +264,22 @@ def table_lines(table_name, values, y_min, y_max):
     y_step  = (y_max - y_min) / max(num_y - 1, 1)
     y_marks = [fmt(y_min + i * y_step) for i in range(num_y)]
     ylabel  = f"-0.05 {' '.join(y_marks)}"
-    data    = "0 " + " ".join(fmt(v) for v in values)
+    return bounds, xlabel, ylabel
+
+
+def table_lines(table_name, values, y_min, y_max):
+    """Return a list of semicolon-terminated Pd message strings for one table."""
+    return table_message(table_name, len(values), y_min, y_max, " ".join(map(fmt, values.tolist())))
+
+
+def table_lines_int(table_name, values, y_min, y_max):
+    """table_lines() for integer-only arrays (pitch, velocity): no float formatting."""
+    return table_message(table_name, len(values), y_min, y_max, " ".join(map(str, values.tolist())))
+
+
+def table_message(table_name, n, y_min, y_max, values_str):
+    bounds, xlabel, ylabel = axis_labels(n, y_min, y_max)
+    data = "0 " + values_str
 
     return [
         f"; {table_name} resize {n}",
@@ -176,45 +294,33 @@ def table_lines(table_name, values, y_min, y_max):
 # Main
 # ---------------------------------------------------------------------------
 
-def main():
-    ap = argparse.ArgumentParser(description="Convert MIDI to a single PlugData table init message")
-    ap.add_argument("midi_file",              help="Input .mid file")
-    ap.add_argument("--max-voices", type=int, default=3,
-                    help="Number of voices/table sets (default: 3)")
-    args = ap.parse_args()
-
-    midi_path  = args.midi_file
-    max_voices = args.max_voices
-    base       = midi_path.rsplit(".", 1)[0]
+def process_one(midi_path, max_voices):
+    """Convert one .mid file and return its summary report, or None if it has no notes."""
+    base = midi_path.rsplit(".", 1)[0]
 
-    notes, ppq = extract(midi_path)
+    notes, ppq, first_tempo = extract(midi_path)
 
-    if not notes:
-        print("No notes found.")
-        sys.exit(1)
+    if not len(notes[0]):
+        return None
 
     voices  = assign_voices(notes, max_voices)
     nv      = len(voices)
-    n       = len(voices[0])
-    max_dur = max(note[2] for note in notes)
+    n       = len(voices[0][0])
+    max_dur = notes[2].max()
 
     # Metro interval from the first tempo event in the file
-    mid_file = mido.MidiFile(midi_path)
-    first_tempo = 500000
-    for msg in mido.merge_tracks(mid_file.tracks):
-        if msg.type == "set_tempo":
-            first_tempo = msg.tempo
-            break
     metro_ms = round(first_tempo / 1000.0, 3)  # microseconds per beat -> ms per beat
     bpm      = round(60_000_000 / first_tempo, 2)
 
-    print(f"\nNotes found   : {len(notes)}")
-    print(f"PPQ           : {ppq}")
-    print(f"BPM           : {bpm}")
-    print(f"Metro interval: {metro_ms} ms")
-    print(f"Voices        : {nv}")
-    print(f"Table size    : {n} slots per voice")
-    print(f"Use [mod {n}] in your sequencer counter\n")
+    report = [
+        f"\nNotes found   : {len(notes[0])}",
+        f"PPQ           : {ppq}",
+        f"BPM           : {bpm}",
+        f"Metro interval: {metro_ms} ms",
+        f"Voices        : {nv}",
+        f"Table size    : {n} slots per voice",
+        f"Use [mod {n}] in your sequencer counter\n",
+    ]
 
     # Build one combined message: seq_size + seq_metro + all 9 tables
     all_lines = []
@@ -224,23 +330,78 @@ def main():
     all_lines.append(f"; seq_size 0 {n}")
     all_lines.append(f"; seq_metro 0 {metro_ms}")
 
-    for vi, voice in enumerate(voices):
-        pitches = [note[0] for note in voice]
-        vels    = [note[1] for note in voice]
-        durs    = [note[2] for note in voice]
+    for vi, (pitches, vels, durs) in enumerate(voices):
+        all_lines += table_lines_int(f"seq_pitch_{vi}",  pitches, 0,     127)
+        all_lines += table_lines_int(f"seq_vel_{vi}",    vels,    0,     127)
+        all_lines += table_lines(f"seq_dur_ms_{vi}",     durs,    0, max_dur)
 
-        all_lines += table_lines(f"seq_pitch_{vi}",  pitches, 0,     127)
-        all_lines += table_lines(f"seq_vel_{vi}",    vels,    0,     127)
-        all_lines += table_lines(f"seq_dur_ms_{vi}", durs,    0, max_dur)
+    # Write as a single Pd message box (backslash-continuation between
+    # statements), line by line rather than joining one giant string first
+    out_path = base + "_init_msg.txt"
+    with open(out_path, "w", buffering=1 << 20) as f:
+        f.writelines(line + " \\\n" for line in all_lines[:-1])
+        f.write(all_lines[-1] + "\n")
 
-    # Join as a single Pd message box (backslash-continuation between statements)
-    combined = " \\\n".join(all_lines)
+    report.append(f"  wrote: {out_path}")
+    return "\n".join(report)
 
-    out_path = base + "_init_msg.txt"
-    with open(out_path, "w") as f:
-        f.write(combined + "\n")
 
-    print(f"  wrote: {out_path}")
+def batch_paths(pattern):
+    """Expand a directory (all .mid files in it) or a glob pattern into sorted paths."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.mid")
+    return sorted(glob.glob(pattern))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Convert MIDI to a single PlugData table init message")
+    ap.add_argument("midi_file",
+                    help="Input .mid file (or directory/glob with --batch)")
+    ap.add_argument("--max-voices", type=int, default=3,
+                    help="Number of voices/table sets (default: 3)")
+    ap.add_argument("--batch", action="store_true",
+                    help="Treat midi_file as a directory or glob and convert every match")
+    ap.add_argument("--jobs", type=int, default=None,
+                    help="Worker processes for --batch (default: one per CPU)")
+    args = ap.parse_args()
+
+    if args.jobs is not None and not args.batch:
+        ap.error("--jobs requires --batch")
+    if args.jobs is not None and args.jobs < 1:
+        ap.error("--jobs must be at least 1")
+
+    if not args.batch:
+        report = process_one(args.midi_file, args.max_voices)
+        if report is None:
+            print("No notes found.")
+            sys.exit(1)
+        print(report)
+        return
+
+    paths = batch_paths(args.midi_file)
+    if not paths:
+        print(f"No MIDI files match {args.midi_file}")
+        sys.exit(1)
+
+    # mido parsing is pure Python and GIL-bound, so fan out over processes.
+    # Each file is reported on its own so one bad file doesn't sink the batch.
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as ex:
+        futures = [ex.submit(process_one, path, args.max_voices) for path in paths]
+        for midi_path, future in zip(paths, futures):
+            print(f"\n== {midi_path}")
+            try:
+                report = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Failed: {type(e).__name__}: {e}")
+                continue
+            print(report if report is not None else "No notes found.")
+
+    if failed:
+        print(f"\n{failed} of {len(paths)} files failed.")
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     main()